@@ -1,131 +1,283 @@
 import os
+import json
+import logging
 import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 from datetime import datetime
 from dotenv import load_dotenv
 
-from modules.generator import ContentGenerator
-from modules.image_provider import ImageProvider
-from modules.linkedin import LinkedInClient
+from modules import checkpoint
 
 # Load environment variables
 load_dotenv()
 
-def generate_draft():
-    print("Initializing Generator...")
+logger = logging.getLogger(__name__)
+
+class PublishError(Exception):
+    """A publish that can't go ahead: missing draft or credentials, or an unresolved earlier attempt"""
+
+def _write_draft(text_path, formatted_text):
+    # Write to a temp file and swap it in so an interrupted run never leaves a half-written draft
+    tmp_path = text_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8", buffering=1 << 16) as f:
+        f.write(formatted_text)
+    os.replace(tmp_path, text_path)
+
+def _set_github_output(**outputs):
+    """Append step outputs to $GITHUB_OUTPUT (replaces the deprecated ::set-output)"""
+    output_file = os.getenv("GITHUB_OUTPUT")
+    if not output_file:
+        return
+    with open(output_file, "a", encoding="utf-8") as f:
+        f.write("".join(f"{name}={value}\n" for name, value in outputs.items()))
+
+def generate_draft(force=False):
+    # Imported here so publish mode doesn't pay for the google-genai import
+    from modules.generator import ContentGenerator
+    from modules.image_provider import ImageProvider
+
+    logger.info("Initializing Generator...")
     gemini_key = os.getenv("GEMINI_API_KEY")
     if not gemini_key:
-        print("Error: GEMINI_API_KEY not found in env.")
+        logger.error("Error: GEMINI_API_KEY not found in env.")
         exit(1)
 
-    generator = ContentGenerator(gemini_key)
-    image_provider = ImageProvider(gemini_key)
-    
-    # 1. Generate Topic & Text & Image Prompt (Single Call)
-    print("Generating full content (Topic + Text + Image Prompt)...")
-    content = generator.generate_full_content()
-    
-    print(f"Selected Topic: {content['topic']}")
-    
-    # 2. Generate Image
-    print("Generating image...")
-    # Clean filename
     date_str = datetime.now().strftime("%Y-%m-%d")
     draft_dir = os.path.join(os.getcwd(), "drafts")
-    os.makedirs(draft_dir, exist_ok=True)
-    
     image_path = os.path.join(draft_dir, f"image_{date_str}.png")
     text_path = os.path.join(draft_dir, f"post_{date_str}.md")
-    
-    success = image_provider.generate_and_save(content['image_prompt'], image_path)
-    if not success:
-        print("Warning: Image generation failed. Proceeding with text only.")
-    
-    # 3. Save Draft
-    # Sanitize YAML strings: Escape quotes and wrap in quotes to handle colons
-    safe_topic = content['topic'].replace('"', '\\"')
-    safe_prompt = content['image_prompt'].replace('"', '\\"')
-    
-    formatted_text = f"""---
-topic: "{safe_topic}"
-image_prompt: "{safe_prompt}"
----
-{content['text']}
-"""
-    with open(text_path, "w", encoding="utf-8") as f:
-        f.write(formatted_text)
-        
-    print(f"Draft saved to:\n- {text_path}\n- {image_path}")
+
+    # Re-runs of the workflow shouldn't pay for another LLM + image round trip
+    if not force and os.path.exists(text_path) and os.path.exists(image_path):
+        logger.info("Draft for %s already exists, skipping (pass --force to regenerate).", date_str)
+        # Lets the workflow skip opening a second review issue for the same draft
+        _set_github_output(skipped="true")
+        return
+
+    generator = ContentGenerator.get_shared(gemini_key)
+
+    with ThreadPoolExecutor(max_workers=3) as executor:
+        # Setup work doesn't depend on the LLM output, so overlap it with the call
+        dir_future = executor.submit(os.makedirs, draft_dir, exist_ok=True)
+        provider_future = executor.submit(ImageProvider, gemini_key)
+        image_futures = []
+
+        def start_image(image_prompt):
+            # 2. Generate Image as soon as its prompt has streamed in, while the post is still being written
+            logger.info("Generating image...")
+            image_futures.append(executor.submit(
+                lambda: provider_future.result().generate_and_save(image_prompt, image_path)
+            ))
+
+        # 1. Generate Topic & Text & Image Prompt (Single Call)
+        logger.info("Generating full content (Topic + Text + Image Prompt)...")
+        try:
+            content = generator.generate_full_content(
+                force=force,
+                on_topic_ready=lambda topic: logger.info("Selected Topic: %s", topic),
+                on_image_prompt=start_image
+            )
+        except Exception:
+            # An image already started for this run has no post to go with; don't leave
+            # it behind for the workflow's `git add drafts/`
+            if image_futures:
+                wait(image_futures)
+                if os.path.exists(image_path):
+                    os.remove(image_path)
+            raise
+
+        dir_future.result()
+
+        # JSON strings are valid YAML double-quoted scalars, so json.dumps handles
+        # quotes, backslashes, newlines and control characters in one pass
+        safe_topic = json.dumps(content['topic'], ensure_ascii=False)
+        safe_prompt = json.dumps(content['image_prompt'], ensure_ascii=False)
+
+        formatted_text = f"---\ntopic: {safe_topic}\nimage_prompt: {safe_prompt}\n---\n{content['text']}\n"
+
+        # 3. Save Draft while the image finishes
+        image_future = image_futures[0]
+        text_future = executor.submit(_write_draft, text_path, formatted_text)
+
+        for future in as_completed([image_future, text_future]):
+            future.result()
+
+        if not image_future.result():
+            logger.warning("Warning: Image generation failed. Proceeding with text only.")
+
+    logger.info("Draft saved to:\n- %s\n- %s", text_path, image_path)
     
     # For GitHub Actions output (if needed)
-    print(f"::set-output name=draft_text_path::{text_path}")
-    print(f"::set-output name=draft_image_path::{image_path}")
+    _set_github_output(draft_text_path=text_path, draft_image_path=image_path, skipped="false")
+
+def publish_post(draft_date=None, force=False):
+    from requests import HTTPError
+    from modules.linkedin import LinkedInClient
 
-def publish_post(draft_date=None):
     if not draft_date:
         draft_date = datetime.now().strftime("%Y-%m-%d")
+
+    # A repeated /publish (or a resume) must not post the same draft twice
+    entry = checkpoint.get(draft_date)
+    if entry and entry.get("state") == checkpoint.POSTED:
+        logger.info("Draft %s was already published (post %s), skipping.", draft_date, entry.get("post_id"))
+        return
         
-    text_path = os.path.join("drafts", f"post_{draft_date}.md")
-    image_path = os.path.join("drafts", f"image_{draft_date}.png")
+    draft_dir = "drafts"
+    text_name = f"post_{draft_date}.md"
+    image_name = f"image_{draft_date}.png"
+    text_path = os.path.join(draft_dir, text_name)
+    image_path = os.path.join(draft_dir, image_name)
+
+    # One directory read answers both existence checks
+    try:
+        with os.scandir(draft_dir) as entries:
+            existing = {entry.name for entry in entries}
+    except FileNotFoundError:
+        existing = set()
     
-    if not os.path.exists(text_path):
-        print(f"Error: Draft not found at {text_path}")
-        exit(1)
+    if text_name not in existing:
+        raise PublishError(f"Draft not found at {text_path}")
         
     # Read Text (Robust Skip Frontmatter)
+    # Stream past the frontmatter line by line so only the post body is read into memory
     with open(text_path, 'r', encoding="utf-8") as f:
-        content = f.read()
-        
-    print(f"File total length: {len(content)} chars")
-    
-    # Use regex to find frontmatter more reliably
-    import re
-    # Match from start, find --- and another ---
-    match = re.split(r'^---.*?\n---\s*', content, flags=re.DOTALL | re.MULTILINE)
-    
-    if len(match) > 1:
-        # The content after the second ---
-        final_text = match[1].strip()
-    else:
-        # Fallback to the split method if regex fails
-        parts = content.split("---", 2)
-        if len(parts) >= 3:
-            final_text = parts[2].strip()
+        first_line = f.readline()
+        if first_line.strip() == "---":
+            skipped = [first_line]
+            closed = False
+            for line in f:
+                if line.strip() == "---":
+                    closed = True
+                    break
+                skipped.append(line)
+            # An unterminated frontmatter block means the whole file is the post
+            final_text = f.read() if closed else "".join(skipped)
         else:
-            final_text = content
+            final_text = first_line + f.read()
+    final_text = final_text.strip()
             
-    print(f"Final text length to send: {len(final_text)} chars")
+    logger.info("Final text length to send: %d chars", len(final_text))
     if len(final_text) > 0:
-        import sys
-        print(f"Content Sample (First 300): {final_text[:300]}")
-        print(f"Content Sample (Last 300): {final_text[-300:]}")
-        sys.stdout.flush()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Content Sample (First 300): %s\nContent Sample (Last 300): %s",
+                final_text[:300], final_text[-300:]
+            )
     else:
-        print("WARNING: Final text is EMPTY!")
+        logger.warning("WARNING: Final text is EMPTY!")
         
     # Publish
     access_token = os.getenv("LINKEDIN_ACCESS_TOKEN")
     author_urn = os.getenv("LINKEDIN_AUTHOR_URN")
     
     if not access_token or not author_urn:
-        print("Error: LinkedIn Credentials missing.")
-        exit(1)
+        raise PublishError("LinkedIn Credentials missing.")
         
     client = LinkedInClient(access_token, author_urn)
+
+    if entry and entry.get("state") == checkpoint.POSTING and not force:
+        # An earlier create_post never got an answer, so it may be live: look before posting again
+        try:
+            post_id = client.find_recent_post(final_text)
+        except HTTPError as e:
+            raise PublishError(
+                f"An earlier publish of {draft_date} may already be live and recent posts could not be checked ({e}). "
+                f"If it is on LinkedIn run `python main.py abandon --date {draft_date}`, "
+                f"otherwise `python main.py publish --date {draft_date} --force`."
+            ) from e
+        if post_id:
+            logger.info("Earlier publish of %s went live as %s, recording it.", draft_date, post_id)
+            checkpoint.mark_posted(draft_date, post_id)
+            return
+
+    has_image = image_name in existing
+    checkpoint.update(
+        draft_date,
+        state=checkpoint.STARTED,
+        text_path=text_path,
+        image_path=image_path if has_image else None
+    )
     
-    if os.path.exists(image_path):
-        client.post_image_and_text(final_text, image_path)
+    if has_image:
+        image_urn = client.upload_image_file(image_path)
     else:
-        print("Image not found, posting text only.")
-        client.create_post(final_text)
+        logger.info("Image not found, posting text only.")
+        image_urn = None
+
+    # From here on a lost response leaves the outcome unknown
+    checkpoint.update(draft_date, state=checkpoint.POSTING)
+    try:
+        post_id = client.create_post(final_text, image_urn)
+    except HTTPError as e:
+        # A 4xx means LinkedIn refused the post outright, so sending it again can't double it
+        if e.response is not None and e.response.status_code < 500:
+            checkpoint.update(draft_date, state=checkpoint.REJECTED)
+        raise
+    logger.info("Successfully posted! ID: %s", post_id)
+
+    checkpoint.mark_posted(draft_date, post_id)
+
+def resume_pending():
+    """Retry publishes that were started but never confirmed (e.g. the process died on a LinkedIn 5xx)"""
+    pending = checkpoint.load_pending()
+    if not pending:
+        logger.info("No interrupted publishes to resume.")
+        return
+    failed = 0
+    for entry in pending:
+        text_path = entry.get("text_path")
+        if not text_path or not os.path.exists(text_path):
+            # Nothing left to publish, so stop carrying the entry from run to run
+            logger.warning("Abandoning %s: draft %s no longer exists.", entry["id"], text_path)
+            checkpoint.mark_abandoned(entry["id"], f"draft {text_path} no longer exists")
+            continue
+        logger.info("Resuming publish for %s...", entry["id"])
+        # One bad entry must not keep the rest from being tried
+        try:
+            publish_post(entry["id"])
+        except Exception as e:
+            logger.error("Resuming %s failed: %s", entry["id"], e)
+            failed += 1
+    if failed:
+        exit(1)
+
+def abandon_pending(draft_date):
+    """Stop resuming a publish that was resolved by hand (e.g. confirmed live on LinkedIn)"""
+    if not checkpoint.get(draft_date):
+        raise PublishError(f"No publish recorded for {draft_date}")
+    checkpoint.mark_abandoned(draft_date, "resolved by hand")
+    logger.info("Marked %s as abandoned.", draft_date)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("mode", choices=["draft", "publish"], help="Action to perform")
-    parser.add_argument("--date", help="Specific date for publish mode YYYY-MM-DD", default=None)
+    parser.add_argument("mode", choices=["draft", "publish", "resume", "abandon"], help="Action to perform")
+    parser.add_argument("--date", help="Specific date for publish/abandon mode YYYY-MM-DD", default=None)
+    parser.add_argument("--force", action="store_true", help=(
+        "Draft mode: regenerate even if today's draft or cached LLM output exists. "
+        "Publish mode: post even if an earlier attempt's outcome is unknown"
+    ))
     
     args = parser.parse_args()
+
+    level_name = os.getenv("LOG_LEVEL", "INFO").upper()
+    level = logging.getLevelNamesMapping().get(level_name)
+    logging.basicConfig(level=logging.INFO if level is None else level, format="%(message)s")
+    if level is None:
+        logger.warning("Unknown LOG_LEVEL %r, using INFO.", level_name)
     
     if args.mode == "draft":
-        generate_draft()
-    elif args.mode == "publish":
-        publish_post(args.date)
+        generate_draft(args.force)
+    else:
+        try:
+            if args.mode == "publish":
+                publish_post(args.date, args.force)
+            elif args.mode == "resume":
+                resume_pending()
+            elif args.mode == "abandon":
+                if not args.date:
+                    parser.error("abandon mode requires --date")
+                abandon_pending(args.date)
+        except PublishError as e:
+            logger.error("Error: %s", e)
+            exit(1)
@@ -0,0 +1,75 @@
+import os
+import json
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# One JSON object per line; later lines for the same id supersede earlier ones.
+# Lives in drafts/ (committed, like category_state.json) so it survives fresh CI checkouts.
+CHECKPOINT_FILE = "drafts/publish_state.jsonl"
+
+# Entry states, in the order a publish moves through them
+STARTED = "started"      # recorded, nothing sent to LinkedIn's posts endpoint yet
+POSTING = "posting"      # create_post was sent; the post may be live even if we never heard back
+REJECTED = "rejected"    # LinkedIn answered the create_post with a 4xx, so it is safe to send again
+POSTED = "posted"
+ABANDONED = "abandoned"  # given up on (draft deleted, or resolved by hand)
+
+def load(path: str = CHECKPOINT_FILE) -> Dict[str, dict]:
+    """Return the latest entry per id"""
+    entries = {}
+    if not os.path.exists(path):
+        return entries
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError as e:
+                # A crash mid-append can leave a torn last line; skip it
+                logger.warning("Skipping unreadable checkpoint line: %s", e)
+                continue
+            entries[entry["id"]] = entry
+    return entries
+
+def get(entry_id: str, path: str = CHECKPOINT_FILE) -> Optional[dict]:
+    return load(path).get(entry_id)
+
+def append(entry: dict, path: str = CHECKPOINT_FILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+def update(entry_id: str, path: str = CHECKPOINT_FILE, **fields):
+    """Append a new record for entry_id with fields merged over its latest one"""
+    entry = dict(get(entry_id, path) or {"id": entry_id})
+    entry.update(fields)
+    append(entry, path)
+
+def load_pending(path: str = CHECKPOINT_FILE) -> List[dict]:
+    """Entries whose publish started but was neither completed nor abandoned"""
+    return [entry for entry in load(path).values() if entry.get("state") not in (POSTED, ABANDONED)]
+
+def mark_abandoned(entry_id: str, reason: str, path: str = CHECKPOINT_FILE):
+    update(entry_id, path, state=ABANDONED, reason=reason)
+
+def mark_posted(entry_id: str, post_id: str, path: str = CHECKPOINT_FILE):
+    """Flip an entry to posted, compacting the file to one line per id"""
+    entries = load(path)
+    entry = entries.setdefault(entry_id, {"id": entry_id})
+    entry["state"] = POSTED
+    entry["post_id"] = post_id
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        for item in entries.values():
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+        # The posted record is what prevents a double post, so make it as durable as append
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
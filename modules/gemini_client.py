@@ -0,0 +1,11 @@
+import functools
+
+@functools.lru_cache(maxsize=4)
+def get_client(api_key: str):
+    """
+    Shared genai.Client per API key, so ContentGenerator and ImageProvider reuse one
+    HTTP connection pool and auth setup instead of building their own.
+    """
+    # Deferred import: google-genai pulls in a large dependency tree
+    from google import genai
+    return genai.Client(api_key=api_key)
@@ -1,17 +1,149 @@
 import os
+import re
 import random
 import json
-from google import genai
-from typing import Dict
+import time
+import functools
+import logging
+import sqlite3
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from modules.gemini_client import get_client
+from modules.llm_cache import LLMCache
+
+logger = logging.getLogger(__name__)
+
+# Markdown **bold** spans, compiled once at import
+_BOLD_RE = re.compile(r'\*\*(.*?)\*\*')
+
+# Unicode sans-serif bold lives at a fixed offset from ASCII in the Mathematical
+# Alphanumeric Symbols block, so the code point table is plain arithmetic.
+_BOLD_RANGES = (
+    (0x41, 0x5A, 0x1D5D4),  # A-Z
+    (0x61, 0x7A, 0x1D5EE),  # a-z
+    (0x30, 0x39, 0x1D7EC),  # 0-9
+)
+_BOLD_MAP = {
+    cp: cp - first + target
+    for first, last, target in _BOLD_RANGES
+    for cp in range(first, last + 1)
+}
+
+# Static part of the prompt. It is sent first and never changes between runs, so
+# Gemini's implicit prefix caching can reuse it; everything run-specific goes in
+# the suffix below.
+_PROMPT_PREFIX = """
+Act as a Senior Integration Engineer specializing in high-scale enterprise architectures. 
+You daily manage complex logic between WMS, OMS, and ERPs like NetSuite or SAP.
+
+Task 1: Select a specific, advanced technical sub-topic within the category given at the end of this prompt. 
+Focus strictly on actual architectural challenges, hybrid patterns (API + EDI), or scaling issues. 
+DO NOT write about basic 856/ASN unless it involves a complex hybrid sync or specific ERP-side deadlock resolution.
+
+Task 2: Write a high-quality LinkedIn post (MAX 280 words).
+- **VOICE**: Direct, professional, and zero-fluff. Like a consultant sharing a "lesson learned" with a peer.
+- **FORBIDDEN**: Do NOT use AI clichés like "In today's fast-paced world", "Unlocking potential", "Delve into", "The key to success is...", "Imagine a world...", "In the ever-evolving...".
+- **STYLE**: Start with a bold technical observation or a "how-to" tip. Use short paragraphs. Use bullet points for technical specs if needed.
+- **LIMIT**: Total length MUST be under 1900 characters.
+- Structure: 
+    1. **The Hook** (A technical observation or a specific industry challenge).
+    2. **The Insight** (Why this specific detail matters in a real-world WMS/EDI environment).
+    3. **Actionable Advice** (A specific recommendation or technical approach).
+    4. **The Peer Question** (Ask for the reader's opinion on this specific technical area).
+    5. Relevant Hashtags (2 empty lines before them).
+- Formatting: Use **double asterisks** for emphasis on critical technical terms only (max 5-6 per post).
+
+Task 3: Write a realistic and technological image prompt (max 50 words).
+- **GOAL**: Create a high-end, professional visual that looks like it belongs in a tech journal.
+- **FORBIDDEN**: No painterly styles, no "artist-drawn" looks, no generic sketches.
+- **MANDATORY STYLES**: For EACH post, rotate through: [High-end Industrial Photography, 4K Detailed 3D Tech Render, Clean Modern Blueprint, Futuristic Data Interface, Close-up Macro of Advanced Electronics, Isometric Logistics Network Visualization].
+- **VIBE**: Cinematic lighting, sharp focus, professional color grading (deep blues, teals, or clean whites).
+- **COMPOSITION**: Specify a professional camera angle (e.g., "Shallow depth of field", "Wide-angle industrial shot", "Macro lens detail").
+- **CONTENT**: No people. Focus on the machinery, the code-data interface, or the architectural logic of logistics.
+
+Output Format (STRICT, in this order):
+[TOPIC_START]
+Topic Title
+[TOPIC_END]
+[IMAGE_PROMPT_START]
+Image prompt
+[IMAGE_PROMPT_END]
+[POST_START]
+Post content
+[POST_END]
+"""
+
+_CATEGORIES = (
+    "WMS (Warehouse Management Systems) Architecture",
+    "ERP Integration Patterns (NetSuite, SAP, Microsoft Dynamics)",
+    "OMS (Order Management) & Multi-Channel Fulfillment",
+    "Complex EDI Workflows beyond the 856 (850, 846, 940/945 hierarchy)",
+    "Hybrid API/EDI Integration Strategies",
+    "Real-time Inventory Sync at Scale",
+    "Logistics Middleware & Enterprise Service Bus (ESB)",
+    "Error Handling & Idempotency in High-Volume Logistics APIs",
+    "Cloud-Native Integration Architectures for Supply Chain"
+)
+
+# Categories are rotated in Python (see ContentGenerator._next_category), so the
+# only run-specific parts of the prompt are the chosen category and the history block
+_PROMPT = _PROMPT_PREFIX + """
+Sub-topic MUST be drawn from: {category}.
+{history_constraint}
+"""
+
+_HISTORY_TEMPLATE = """
+**CRITICAL: TOPIC UNIQUENESS REQUIREMENT**
+You have recently written about the following topics. DO NOT select these or closely related topics:
+{history_list}
+Choose something COMPLETELY DIFFERENT from the above list.
+"""
+
+# One precompiled pattern per response section, capturing the text between its tags
+_SECTION_RES = {
+    key: re.compile(rf"\[{tag}_START\](.*?)\[{tag}_END\]", re.DOTALL)
+    for key, tag in (("topic", "TOPIC"), ("text", "POST"), ("image_prompt", "IMAGE_PROMPT"))
+}
+
+def _extract_sections(content: str) -> Dict[str, str]:
+    """
+    Pull each tagged section out of the response.
+    Missing sections come back as "" so the caller's fallbacks apply.
+    """
+    sections = {}
+    for key, pattern in _SECTION_RES.items():
+        match = pattern.search(content)
+        sections[key] = match.group(1).strip() if match else ""
+    return sections
+
+# google-genai APIError codes worth retrying
+_TRANSIENT_CODES = {429, 500, 502, 503, 504}
 
 class ContentGenerator:
     def __init__(self, api_key: str):
         if not api_key:
             raise ValueError("Gemini API Key is required")
-        
-        self.client = genai.Client(api_key=api_key)
-        self.model_name = "nano-banana-pro-preview"
+
+        self.client = get_client(api_key)
+        self.model_name = "models/gemini-2.5-flash"
         self.history_file = "drafts/history.json"
+        self.category_state_file = "drafts/category_state.json"
+        self.cache_ttl = 86400  # 1 day
+        # LLM_CACHE_DISABLED=1 turns the response cache off (e.g. for production runs)
+        self.cache = None
+        if os.getenv("LLM_CACHE_DISABLED") != "1":
+            try:
+                self.cache = LLMCache()
+            except (sqlite3.Error, OSError) as e:
+                # The cache is best-effort like its get/set; an unwritable or corrupt .cache/ must not abort the draft
+                logger.warning("LLM cache unavailable, continuing without it: %s", e)
+
+    @classmethod
+    @functools.lru_cache(maxsize=None)
+    def get_shared(cls, api_key: str) -> "ContentGenerator":
+        """Return a per-API-key instance so long-running callers reuse one genai client"""
+        return cls(api_key)
         
     def _load_topic_history(self) -> list:
         """Load the last 15 topics from history file"""
@@ -22,7 +154,7 @@ class ContentGenerator:
                 history = json.load(f)
                 return history[-15:]  # Last 15 topics
         except Exception as e:
-            print(f"Failed to load history: {e}")
+            logger.warning("Failed to load history: %s", e)
             return []
     
     def _save_topic_to_history(self, topic: str):
@@ -37,121 +169,200 @@ class ContentGenerator:
             with open(self.history_file, 'w', encoding='utf-8') as f:
                 json.dump(history, f, ensure_ascii=False, indent=2)
         except Exception as e:
-            print(f"Failed to save history: {e}")
+            logger.warning("Failed to save history: %s", e)
         
-    def generate_full_content(self) -> Dict[str, str]:
+    @staticmethod
+    def _error_code(error: Exception) -> Optional[int]:
+        """HTTP status of a google-genai APIError, or None for anything else"""
+        code = getattr(error, "code", None)
+        if isinstance(code, int):
+            return code
+        if "RESOURCE_EXHAUSTED" in str(error):
+            return 429
+        return None
+
+    def _stream_text(self, model: str, prompt: str, service_tier: str,
+                     on_progress: Optional[Callable[[str], None]] = None) -> str:
+        """
+        Streams the model response and returns the full text, calling on_progress with the
+        text received so far after each chunk.
+        """
+        from google.genai import types
+
+        try:
+            config = types.GenerateContentConfig(service_tier=service_tier)
+        except (TypeError, ValueError) as e:
+            # Older google-genai releases don't know the field (pydantic rejects it); a
+            # default-tier draft beats no draft
+            logger.warning("google-genai rejected service_tier=%r, using the default tier: %s", service_tier, e)
+            config = None
+
+        text = ""
+        for chunk in self.client.models.generate_content_stream(
+            model=model,
+            contents=prompt,
+            config=config
+        ):
+            if chunk.text:
+                text += chunk.text
+                if on_progress:
+                    on_progress(text)
+        return text
+
+    def _generate_with_backoff(self, model: str, prompt: str,
+                               on_progress: Optional[Callable[[str], None]] = None,
+                               service_tier: str = "priority",
+                               max_attempts: int = 2,
+                               retry_prompt: Optional[Callable[[], str]] = None) -> str:
+        """
+        Streams the response at the given service tier. Priority requests aren't shed
+        (they downgrade to standard instead of returning 429), so only the occasional
+        transient error (429/5xx) is retried, with jittered exponential backoff.
+        retry_prompt, if given, supplies the prompt for each retry.
+        Any other error (or running out of attempts) is raised to the caller.
+        """
+        for attempt in range(1, max_attempts + 1):
+            if attempt > 1 and retry_prompt:
+                prompt = retry_prompt()
+            try:
+                return self._stream_text(model, prompt, service_tier, on_progress)
+            except Exception as e:
+                code = self._error_code(e)
+                if attempt == max_attempts or code not in _TRANSIENT_CODES:
+                    raise
+                delay = max(1.0, random.uniform(0, min(30, 2 ** attempt)))
+                logger.info("Model %s returned %d, retrying in %.1fs (%d/%d)...", model, code, delay, attempt, max_attempts)
+                time.sleep(delay)
+
+    def generate_full_content(self, force: bool = False,
+                              on_topic_ready: Optional[Callable[[str], None]] = None,
+                              on_image_prompt: Optional[Callable[[str], None]] = None) -> Dict[str, str]:
         """
         Generates Topic, Post, and Image Prompt in a single API call to avoid 429 Rate Limits.
+        Results are cached on disk for a day; pass force=True to skip the cache.
+        on_topic_ready and on_image_prompt are each called once, as soon as that section
+        has streamed in. The image prompt is requested before the post text, so callers
+        can start image generation while the post is still being written. If the stream
+        fails after either has fired, the retry is pinned to the values already handed out.
         """
-        categories = [
-            "WMS (Warehouse Management Systems) Architecture",
-            "ERP Integration Patterns (NetSuite, SAP, Microsoft Dynamics)",
-            "OMS (Order Management) & Multi-Channel Fulfillment",
-            "Complex EDI Workflows beyond the 856 (850, 846, 940/945 hierarchy)",
-            "Hybrid API/EDI Integration Strategies",
-            "Real-time Inventory Sync at Scale",
-            "Logistics Middleware & Enterprise Service Bus (ESB)",
-            "Error Handling & Idempotency in High-Volume Logistics APIs",
-            "Cloud-Native Integration Architectures for Supply Chain"
-        ]
+        history_constraint = self._history_constraint()
+        category = self._next_category()
+        prompt = _PROMPT.format(category=category, history_constraint=history_constraint)
+
+        # The history block changes after every successful run, so leave it out of the
+        # key; otherwise a same-day re-run could never hit the cache.
+        cache_key = None
+        if self.cache:
+            cache_key = self.cache.make_key(self.model_name, prompt.replace(history_constraint, ""))
+        if cache_key and not force:
+            cached_text = self.cache.get(cache_key)
+            if cached_text:
+                cached = json.loads(cached_text)
+                logger.info("Using cached content (pass --force to regenerate).")
+                if on_topic_ready:
+                    on_topic_ready(cached["topic"])
+                if on_image_prompt:
+                    on_image_prompt(cached["image_prompt"])
+                return cached
+
+        sent_topic = None
+        sent_image_prompt = None
+
+        def watch_sections(partial: str):
+            nonlocal sent_topic, sent_image_prompt
+            if on_topic_ready and sent_topic is None and "[TOPIC_END]" in partial:
+                topic = _extract_sections(partial)["topic"]
+                if topic:
+                    sent_topic = topic
+                    on_topic_ready(topic)
+            if on_image_prompt and sent_image_prompt is None and "[IMAGE_PROMPT_END]" in partial:
+                image_prompt = _extract_sections(partial)["image_prompt"]
+                if image_prompt:
+                    sent_image_prompt = image_prompt
+                    on_image_prompt(image_prompt)
         
-        # We give the LLM the list and ask IT to pick one and expand on it.
-        context_cats = ", ".join(categories)
+        def pinned_prompt() -> str:
+            # A failed stream may already have handed its topic/image prompt to the caller
+            # (who is generating an image for it), so the retry must write the same post
+            pins = []
+            if sent_topic is not None:
+                pins.append(f"The TOPIC is already fixed. Output exactly this topic and write the post about it: {sent_topic}")
+            if sent_image_prompt is not None:
+                pins.append(f"The IMAGE_PROMPT is already fixed. Output exactly this image prompt: {sent_image_prompt}")
+            return prompt + "\n".join(pins) + "\n" if pins else prompt
         
-        # Load topic history to avoid repetition
-        recent_topics = self._load_topic_history()
-        history_constraint = ""
-        if recent_topics:
-            history_list = "\n".join([f"- {topic}" for topic in recent_topics])
-            history_constraint = f"""
-        **CRITICAL: TOPIC UNIQUENESS REQUIREMENT**
-        You have recently written about the following topics. DO NOT select these or closely related topics:
-        {history_list}
-        Choose something COMPLETELY DIFFERENT from the above list.
+        logger.info("Generating content with model: %s...", self.model_name)
+        content = self._generate_with_backoff(
+            self.model_name, prompt,
+            on_progress=watch_sections if on_topic_ready or on_image_prompt else None,
+            retry_prompt=pinned_prompt
+        ).strip()
+        if not content:
+            raise Exception(f"Model {self.model_name} returned empty response.")
+
+        result = self._parse_content(content)
+
+        # Whatever was already handed out wins, so the saved draft, the logged topic and
+        # the image always come from the same attempt even if the model strayed from the pins
+        if sent_topic is not None:
+            result["topic"] = sent_topic
+        elif on_topic_ready:
+            on_topic_ready(result["topic"])
+        if sent_image_prompt is not None:
+            result["image_prompt"] = sent_image_prompt
+        elif on_image_prompt:
+            on_image_prompt(result["image_prompt"])
+
+        # Save topic to history to avoid future repetition
+        self._save_topic_to_history(result["topic"])
+
+        if cache_key:
+            self.cache.set(cache_key, json.dumps(result, ensure_ascii=False), ttl=self.cache_ttl)
+        return result
+
+    def _next_category(self) -> str:
         """
-        
-        prompt = f"""
-        Act as a Senior Integration Engineer specializing in high-scale enterprise architectures. 
-        You daily manage complex logic between WMS, OMS, and ERPs like NetSuite or SAP.
-        
-        Task 1: Select a specific, advanced technical sub-topic based on these categories: [{context_cats}]. 
-        Focus strictly on actual architectural challenges, hybrid patterns (API + EDI), or scaling issues. 
-        DO NOT write about basic 856/ASN unless it involves a complex hybrid sync or specific ERP-side deadlock resolution.
-        {history_constraint}
-        
-        Task 2: Write a high-quality LinkedIn post (MAX 280 words).
-        - **VOICE**: Direct, professional, and zero-fluff. Like a consultant sharing a "lesson learned" with a peer.
-        - **FORBIDDEN**: Do NOT use AI clichés like "In today's fast-paced world", "Unlocking potential", "Delve into", "The key to success is...", "Imagine a world...", "In the ever-evolving...".
-        - **STYLE**: Start with a bold technical observation or a "how-to" tip. Use short paragraphs. Use bullet points for technical specs if needed.
-        - **LIMIT**: Total length MUST be under 1900 characters.
-        - Structure: 
-            1. **The Hook** (A technical observation or a specific industry challenge).
-            2. **The Insight** (Why this specific detail matters in a real-world WMS/EDI environment).
-            3. **Actionable Advice** (A specific recommendation or technical approach).
-            4. **The Peer Question** (Ask for the reader's opinion on this specific technical area).
-            5. Relevant Hashtags (2 empty lines before them).
-        - Formatting: Use **double asterisks** for emphasis on critical technical terms only (max 5-6 per post).
-        
-        Task 3: Write a realistic and technological image prompt (max 50 words).
-        - **GOAL**: Create a high-end, professional visual that looks like it belongs in a tech journal.
-        - **FORBIDDEN**: No painterly styles, no "artist-drawn" looks, no generic sketches.
-        - **MANDATORY STYLES**: For EACH post, rotate through: [High-end Industrial Photography, 4K Detailed 3D Tech Render, Clean Modern Blueprint, Futuristic Data Interface, Close-up Macro of Advanced Electronics, Isometric Logistics Network Visualization].
-        - **VIBE**: Cinematic lighting, sharp focus, professional color grading (deep blues, teals, or clean whites).
-        - **COMPOSITION**: Specify a professional camera angle (e.g., "Shallow depth of field", "Wide-angle industrial shot", "Macro lens detail").
-        - **CONTENT**: No people. Focus on the machinery, the code-data interface, or the architectural logic of logistics.
-        
-        Output Format (STRICT):
-        [TOPIC_START]
-        Topic Title
-        [TOPIC_END]
-        [POST_START]
-        Post content
-        [POST_END]
-        [IMAGE_PROMPT_START]
-        Image prompt
-        [IMAGE_PROMPT_END]
+        Round-robin through _CATEGORIES, persisting the position next to the topic history.
+        Runs on the same day reuse that day's starting category, so a retried draft builds
+        the same prompt and can hit the response cache.
         """
-        
-        # Priority list of models (stable models with guaranteed availability)
-        model_fallbacks = [
-            "models/gemini-2.0-flash",
-            "models/gemini-2.5-flash",
-            "models/gemini-2.5-pro"
-        ]
-        
-        last_exception = None
-        for current_model in model_fallbacks:
+        today = datetime.now().strftime("%Y-%m-%d")
+        state = {}
+        if os.path.exists(self.category_state_file):
             try:
-                print(f"Generating content with model: {current_model}...")
-                response = self.client.models.generate_content(
-                    model=current_model,
-                    contents=prompt
-                )
-                if response and response.text:
-                    content = response.text.strip()
-                    # If we got here, it worked. Break the loop.
-                    break
-                else:
-                    print(f"Model {current_model} returned empty response.")
-                    continue
+                with open(self.category_state_file, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
             except Exception as e:
-                print(f"Model {current_model} failed: {e}")
-                last_exception = e
-                continue
+                logger.warning("Failed to load category state: %s", e)
+
+        if state.get("date") == today:
+            start = state["start"] % len(_CATEGORIES)
         else:
-            # If the loop finished without breaking
-            raise Exception(f"All models failed. Last error: {last_exception}")
-            
-        # Helper to extract content between tags
-        def extract(tag_start, tag_end, text):
-            try:
-                return text.split(tag_start)[1].split(tag_end)[0].strip()
-            except IndexError:
-                return ""
+            start = state.get("next", 0) % len(_CATEGORIES)
+
+        os.makedirs(os.path.dirname(self.category_state_file), exist_ok=True)
+        try:
+            with open(self.category_state_file, 'w', encoding='utf-8') as f:
+                json.dump({"date": today, "start": start, "next": (start + 1) % len(_CATEGORIES)}, f, indent=2)
+        except Exception as e:
+            logger.warning("Failed to save category state: %s", e)
 
-        topic = extract("[TOPIC_START]", "[TOPIC_END]", content)
-        post_text = extract("[POST_START]", "[POST_END]", content)
-        image_prompt = extract("[IMAGE_PROMPT_START]", "[IMAGE_PROMPT_END]", content)
+        return _CATEGORIES[start]
+
+    def _history_constraint(self) -> str:
+        """Prompt block listing recent topics so the model avoids repeating them"""
+        recent_topics = self._load_topic_history()
+        if not recent_topics:
+            return ""
+        history_list = "\n".join([f"- {topic}" for topic in recent_topics])
+        return _HISTORY_TEMPLATE.format(history_list=history_list)
+
+    def _parse_content(self, content: str) -> Dict[str, str]:
+        """Split a raw model response into topic, post text and image prompt"""
+        sections = _extract_sections(content)
+        topic = sections["topic"]
+        post_text = sections["text"]
+        image_prompt = sections["image_prompt"]
         
         # Formatting: Strip Markdown **markers** (LinkedIn doesn't support formatting)
         post_text = self._convert_markdown_bold(post_text)
@@ -161,9 +372,6 @@ class ContentGenerator:
         if not post_text: post_text = content # If tags missing, assume whole text is post
         if not image_prompt: image_prompt = f"Futuristic logistics technology visualization related to {topic}"
 
-        # Save topic to history to avoid future repetition
-        self._save_topic_to_history(topic)
-
         return {
             "topic": topic,
             "text": post_text,
@@ -176,18 +384,13 @@ class ContentGenerator:
         - Phrases with 20 words or less: Convert to Unicode bold
         - Longer phrases: Just strip ** markers
         """
-        import re
-        
+        if "**" not in text:
+            return text
+
         def smart_replace(match):
             content = match.group(1)
-            # Remove existing bold if it's already unicode (unlikely but safe)
-            word_count = len(content.split())
-            
-            if word_count <= 20: 
-                normal = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
-                bold = "𝗔𝗕𝗖𝗗𝗘𝗙𝗚𝗛𝗜𝗝𝗞𝗟𝗠𝗡𝗢𝗣𝗤𝗥𝗦𝗧𝗨𝗩𝗪𝗫𝗬𝗭𝗮𝗯𝗰𝗱𝗲𝗳𝗴𝗵𝗶𝗷𝗸𝗹𝗺𝗻𝗼𝗽𝗾𝗿𝘀𝘁𝘂𝘃𝘄𝘅𝘆𝘇𝟬𝟭𝟮𝟯𝟰𝟱𝟲𝟳𝟴𝟵"
-                mapping = str.maketrans(normal, bold)
-                return content.translate(mapping)
+            if len(content.split()) <= 20:
+                return content.translate(_BOLD_MAP)
             return content
         
-        return re.sub(r'\*\*(.*?)\*\*', smart_replace, text)
+        return _BOLD_RE.sub(smart_replace, text)
@@ -1,15 +1,26 @@
-from google import genai
 from google.genai import types
 from duckduckgo_search import DDGS
 import requests
 import os
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from modules.gemini_client import get_client
+
+logger = logging.getLogger(__name__)
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
 
 class ImageProvider:
     def __init__(self, api_key: str = None):
         self.api_key = api_key
+        # Reused for image downloads so repeat hosts keep their connection alive
+        self.session = requests.Session()
         
         if self.api_key:
-            self.client = genai.Client(api_key=self.api_key)
+            self.client = get_client(self.api_key)
         else:
             self.client = None
 
@@ -24,7 +35,7 @@ class ImageProvider:
             image_models = ["imagen-3.0-generate-001", "nano-banana-pro-preview"]
             for model_id in image_models:
                 try:
-                    print(f"Attempting image generation via Gemini: {model_id}...")
+                    logger.info("Attempting image generation via Gemini: %s...", model_id)
                     response = self.client.models.generate_images(
                         model=model_id,
                         prompt=prompt,
@@ -40,15 +51,15 @@ class ImageProvider:
                         os.makedirs(os.path.dirname(save_path), exist_ok=True)
                         with open(save_path, 'wb') as f:
                             f.write(image_bytes)
-                        print(f"Successfully generated image via Gemini ({model_id}).")
+                        logger.info("Successfully generated image via Gemini (%s).", model_id)
                         return True
                     else:
-                        print(f"Gemini ({model_id}) returned no images.")
+                        logger.warning("Gemini (%s) returned no images.", model_id)
                 except Exception as e:
-                    print(f"Gemini image generation ({model_id}) failed: {e}")
+                    logger.warning("Gemini image generation (%s) failed: %s", model_id, e)
                     continue
         else:
-            print("No Gemini API Key provided for images. Using DuckDuckGo Search...")
+            logger.info("No Gemini API Key provided for images. Using DuckDuckGo Search...")
 
         # 2. Fallback: DuckDuckGo Image Search
         return self._search_via_duckduckgo(prompt, save_path)
@@ -58,7 +69,7 @@ class ImageProvider:
         Searches for a real-world image on DuckDuckGo and downloads it.
         """
         try:
-            print(f"Searching DuckDuckGo for: {prompt[:100]}...")
+            logger.info("Searching DuckDuckGo for: %s...", prompt[:100])
             with DDGS() as ddgs:
                 # Search for high-quality, professional images
                 results = list(ddgs.images(
@@ -70,26 +81,53 @@ class ImageProvider:
                 ))
             
             if not results:
-                print("No images found on DuckDuckGo.")
+                logger.warning("No images found on DuckDuckGo.")
                 return False
             
-            # Try the first few results in case one fails to download
-            for result in results[:5]:
-                try:
-                    img_url = result['image']
-                    print(f"Downloading image from: {img_url}")
-                    response = requests.get(img_url, timeout=15)
-                    if response.status_code == 200:
-                        os.makedirs(os.path.dirname(save_path), exist_ok=True)
-                        with open(save_path, 'wb') as f:
-                            f.write(response.content)
-                        print(f"Successfully downloaded image from DuckDuckGo.")
+            # Request the first few results at once and keep whichever answers 200 first,
+            # so one slow or dead host doesn't hold up the rest
+            urls = [result['image'] for result in results[:5] if result.get('image')]
+            executor = ThreadPoolExecutor(max_workers=max(1, len(urls)))
+            futures = {}
+            for img_url in urls:
+                logger.info("Downloading image from: %s", img_url)
+                futures[executor.submit(self.session.get, img_url, timeout=15, stream=True)] = img_url
+
+            try:
+                for future in as_completed(futures):
+                    img_url = futures.pop(future)
+                    try:
+                        response = future.result()
+                        with response:
+                            if response.status_code != 200:
+                                logger.warning("Failed to download from %s: HTTP %s", img_url, response.status_code)
+                                continue
+                            os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                            # Stream to a temp file in 64 KiB chunks and swap it in, so a
+                            # dropped connection never leaves a truncated image behind
+                            tmp_path = save_path + ".tmp"
+                            try:
+                                with open(tmp_path, 'wb') as f:
+                                    for chunk in response.iter_content(65536):
+                                        f.write(chunk)
+                                os.replace(tmp_path, save_path)
+                            except BaseException:
+                                # Don't leave a partial download behind for `git add drafts/`
+                                if os.path.exists(tmp_path):
+                                    os.remove(tmp_path)
+                                raise
+                        logger.info("Successfully downloaded image from DuckDuckGo.")
                         return True
-                except Exception as e:
-                    print(f"Failed to download from {img_url}: {e}")
-                    continue
+                    except Exception as e:
+                        logger.warning("Failed to download from %s: %s", img_url, e)
+                        continue
+            finally:
+                # Drop the losers: cancel what hasn't started, close what finishes later
+                for future in futures:
+                    future.add_done_callback(_close_response)
+                executor.shutdown(wait=False, cancel_futures=True)
             
             return False
         except Exception as e:
-            print(f"DuckDuckGo search failed: {e}")
+            logger.warning("DuckDuckGo search failed: %s", e)
             return False
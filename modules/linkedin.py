@@ -1,6 +1,42 @@
-import requests
+import re
 import json
-import os
+import logging
+import requests
+from typing import Optional, Tuple
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# orjson is optional: it reads/writes UTF-8 bytes directly; stdlib json is the fallback
+try:
+    import orjson
+    _dumps = orjson.dumps
+    _loads = orjson.loads
+except ImportError:
+    def _dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    _loads = json.loads
+
+logger = logging.getLogger(__name__)
+
+# REST API endpoints and version used by this client
+_API_VERSION = '202401'
+_IMAGES_URL = "https://api.linkedin.com/rest/images?action=initializeUpload"
+_POSTS_URL = "https://api.linkedin.com/rest/posts"
+
+# One-pass normalization: lone '\r' becomes '\n', unicode dashes become '-', and characters
+# known to cause truncation in some LinkedIn API versions are mapped to their escaped form
+_NORMALIZE_TABLE = str.maketrans({
+    '\r': '\n', '—': '-', '–': '-',
+    **{char: f"\\{char}" for char in '()[]{}<>@|~_'}
+})
+# Matches any character the table rewrites; lets clean text skip normalization entirely
+_NORMALIZE_RE = re.compile("[" + re.escape("".join(map(chr, _NORMALIZE_TABLE))) + "]")
+
+def _raise_for_status(response, action: str):
+    """raise_for_status, but log LinkedIn's error body first: it names the offending field"""
+    if not response.ok:
+        logger.error("Failed to %s (HTTP %s): %s", action, response.status_code, response.text[:500])
+    response.raise_for_status()
 
 class LinkedInClient:
     def __init__(self, access_token: str, author_urn: str):
@@ -9,97 +45,112 @@ class LinkedInClient:
         author_urn: Should be in format 'urn:li:person:XXXX' (JNVW-03WF1)
         """
         self.access_token = access_token
-        self.author_urn = author_urn
+        # REST API requires 'urn:li:person' for member profiles; normalize once here
+        self.author_urn = author_urn.replace("urn:li:member:", "urn:li:person:")
         self.headers = {
             'Authorization': f'Bearer {self.access_token}',
             'Content-Type': 'application/json; charset=utf-8',
-            'LinkedIn-Version': '202401',
+            'LinkedIn-Version': _API_VERSION,
             'X-Restli-Protocol-Version': '2.0.0'
         }
+        # The upload registration body only depends on the author, so serialize it once
+        self._register_payload = _dumps({"initializeUploadRequest": {"owner": self.author_urn}})
+        # Constant part of every post; create_post shallow-copies it and fills in the rest
+        self._post_template = {
+            "author": self.author_urn,
+            "visibility": "PUBLIC",
+            "distribution": {
+                "feedDistribution": "MAIN_FEED",
+            },
+            "lifecycleState": "PUBLISHED",
+            "isReshareDisabledByAuthor": False
+        }
 
-    def register_image(self) -> dict:
-        """Step 1: Register image upload using REST API /rest/images"""
-        # Ensure author is in person format for REST API
-        owner_urn = self.author_urn
-        
-        # REST API v202501 requires 'urn:li:person' for member profiles
-        if "urn:li:member:" in owner_urn:
-            owner_urn = owner_urn.replace("urn:li:member:", "urn:li:person:")
+        # Keep-alive session so register -> create_post reuse one TLS connection to api.linkedin.com.
+        # Transient errors are retried (honouring Retry-After) so one 502 doesn't cost a fresh upload
+        # registration; re-sending the image registration or the upload PUT is harmless.
+        retry = Retry(
+            total=5, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["POST", "PUT", "GET"], respect_retry_after_header=True, raise_on_status=False
+        )
+        # Creating a post is not idempotent: only retry when it provably wasn't processed
+        # (connect failures and 429), never after a 5xx or a dropped response
+        post_retry = Retry(
+            total=5, read=0, backoff_factor=0.5, status_forcelist=[429],
+            allowed_methods=["POST"], respect_retry_after_header=True, raise_on_status=False
+        )
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        api_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry)
+        posts_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=post_retry)
+        # Share one pool so create_post reuses register_image's connection; each adapter
+        # still passes its own Retry on every send
+        posts_adapter.poolmanager = api_adapter.poolmanager
+        self.session.mount("https://", api_adapter)
+        # requests picks the longest matching prefix, so this only applies to /rest/posts
+        self.session.mount(_POSTS_URL, posts_adapter)
 
-        data = {
-            "initializeUploadRequest": {
-                "owner": owner_urn
-            }
-        }
-        
-        response = requests.post(
-            "https://api.linkedin.com/rest/images?action=initializeUpload", 
-            headers=self.headers, 
-            json=data
+        # Upload URLs point at LinkedIn's storage host and must not carry the API headers
+        self.upload_session = requests.Session()
+        self.upload_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry))
+
+    def register_image(self) -> Tuple[str, str]:
+        """Step 1: Register image upload using REST API /rest/images. Returns (upload_url, image_urn)"""
+        response = self.session.post(
+            _IMAGES_URL,
+            data=self._register_payload
         )
         
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Failed to register image upload: {response.text}")
-            
-        return response.json()
+        _raise_for_status(response, "register image upload")
+
+        # Parse the raw bytes once and keep only the two fields we use
+        value = _loads(response.content)['value']
+        return value['uploadUrl'], value['image']
 
     def upload_image(self, upload_url: str, file_path: str):
         """Step 2: Upload binary file directly to LinkedIn's storage"""
+        # requests sizes the file via fstat, so this is already a single non-chunked PUT
         with open(file_path, 'rb') as f:
-            response = requests.put(
+            response = self.upload_session.put(
                 upload_url, 
                 data=f, 
                 headers={"Content-Type": "application/octet-stream"}
             )
             
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Failed to upload image binary: {response.text}")
+        _raise_for_status(response, "upload image binary")
 
-    def _escape_linkedin_text(self, text: str) -> str:
+    def _normalize_linkedin_text(self, text: str) -> str:
         """
         LinkedIn's /rest/posts API has a known bug where it truncates text 
         at special characters like ( ) [ ] { } etc.
-        This helper escapes them to prevent truncation.
+        This helper escapes them to prevent truncation, and also unifies
+        line endings to '\n' and unicode dashes to '-'.
         """
-        # List of characters known to cause issues in some LinkedIn API versions
-        special_chars = ['(', ')', '[', ']', '{', '}', '<', '>', '@', '|', '~', '_']
-        for char in special_chars:
-            text = text.replace(char, f"\\{char}")
-        return text
+        if not _NORMALIZE_RE.search(text):
+            return text
+        # '\r\n' is two characters, so it needs its own pass before the table
+        return text.replace('\r\n', '\n').translate(_NORMALIZE_TABLE)
 
-    def create_post(self, text: str, image_urn: str = None) -> str:
-        """Step 3: Create the Post using /rest/posts (2025 Standard)"""
-        
-        # Ensure author uses person URN
-        author_urn = self.author_urn
-        if "urn:li:member:" in author_urn:
-            author_urn = author_urn.replace("urn:li:member:", "urn:li:person:")
-
-        # 1. Normalize text to prevent truncation bugs
-        # Replace Windows line endings (\r\n) with Unix (\n)
-        text = text.replace('\r\n', '\n').replace('\r', '\n')
-        # Replace problematic unicode dashes
-        text = text.replace('—', '-').replace('–', '-')
+    def _prepare_commentary(self, text: str) -> str:
+        """The commentary exactly as create_post sends it"""
+        # 1. Normalize line endings and dashes, and escape special characters
+        # to prevent LinkedIn's truncation bugs
+        text = self._normalize_linkedin_text(text)
         
-        # 2. Fix known LinkedIn API bugs by escaping special characters
-        text = self._escape_linkedin_text(text)
-        
-        # 3. Hard Limit Check: LinkedIn maximum is 3000 chars for commentary
+        # 2. Hard Limit Check: LinkedIn maximum is 3000 chars for commentary
         # Use a safe margin for JSON encoding
         if len(text) > 3000:
-            print(f"Warning: Text too long ({len(text)}). Truncating to 2900.")
+            logger.warning("Text too long (%d). Truncating to 2900.", len(text))
             text = text[:2900] + "... [Full post on profile]"
+        return text
 
-        post_data = {
-            "author": author_urn,
-            "commentary": text,
-            "visibility": "PUBLIC",
-            "distribution": {
-                "feedDistribution": "MAIN_FEED",
-            },
-            "lifecycleState": "PUBLISHED",
-            "isReshareDisabledByAuthor": False
-        }
+    def create_post(self, text: str, image_urn: str = None) -> str:
+        """Step 3: Create the Post using /rest/posts (2025 Standard)"""
+        text = self._prepare_commentary(text)
+        text_len = len(text)
+
+        post_data = self._post_template.copy()
+        post_data["commentary"] = text
 
         if image_urn:
             post_data['content'] = {
@@ -109,33 +160,20 @@ class LinkedInClient:
                 }
             }
 
-        # DEEP DEBUG: Log everything before sending
-        import sys
-        print(f"\n[DEEP DEBUG] TEXT PREVIEW (Total {len(text)} chars):")
-        print("-" * 40)
-        print(f"START: {text[:500]}")
-        print("...")
-        print(f"END: {text[-500:]}")
-        print("-" * 40)
+        # Only pay for the preview slices when someone asked for them (LOG_LEVEL=DEBUG)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Text preview (total %d chars):\nSTART: %s\n...\nEND: %s", text_len, text[:500], text[-500:])
         
-        # Explicitly encode to UTF-8
-        payload = json.dumps(post_data, ensure_ascii=False).encode('utf-8')
+        # Session headers already cover auth/versioning; requests sets Content-Length from the bytes
+        payload = _dumps(post_data)
+        logger.debug("JSON payload size: %d bytes", len(payload))
         
-        # Add explicit Content-Length
-        current_headers = self.headers.copy()
-        current_headers['Content-Length'] = str(len(payload))
-        
-        print(f"[DEEP DEBUG] JSON Payload size: {len(payload)} bytes")
-        sys.stdout.flush()
-        
-        response = requests.post(
-            "https://api.linkedin.com/rest/posts",
-            headers=current_headers,
+        response = self.session.post(
+            _POSTS_URL,
             data=payload
         )
         
-        if response.status_code not in [200, 201]:
-            raise Exception(f"Failed to publish post: {response.text}")
+        _raise_for_status(response, "publish post")
             
         # REST API returns 201 Created with EMPTY body. 
         # The Post ID is in the 'x-restli-id' header.
@@ -146,19 +184,40 @@ class LinkedInClient:
 
         return post_id
 
-    def post_image_and_text(self, text: str, image_file_path: str):
+    def find_recent_post(self, text: str, count: int = 10) -> Optional[str]:
+        """
+        Return the ID of one of the author's `count` most recent posts whose commentary
+        matches what create_post would send for text, or None if there is none.
+        Used to find out whether a create_post whose response was lost actually went live.
+        """
+        commentary = self._prepare_commentary(text).strip()
+        response = self.session.get(
+            _POSTS_URL,
+            params={"q": "author", "author": self.author_urn, "count": count, "sortBy": "LAST_MODIFIED"},
+            headers={"X-RestLi-Method": "FINDER"}
+        )
+        _raise_for_status(response, "list recent posts")
+        for element in _loads(response.content).get("elements", []):
+            if (element.get("commentary") or "").strip() == commentary:
+                return element.get("id")
+        return None
+
+    def upload_image_file(self, image_file_path: str) -> str:
+        """Steps 1-2: register and upload an image, returning its URN for create_post"""
         # 1. Register Image (New REST Way)
-        print("Registering image via REST API...")
-        reg_info = self.register_image()
-        upload_url = reg_info['value']['uploadUrl']
-        image_urn = reg_info['value']['image']
+        logger.info("Registering image via REST API...")
+        upload_url, image_urn = self.register_image()
         
         # 2. Upload Binary
-        print(f"Uploading image binary...")
+        logger.info("Uploading image binary...")
         self.upload_image(upload_url, image_file_path)
+        return image_urn
+
+    def post_image_and_text(self, text: str, image_file_path: str):
+        image_urn = self.upload_image_file(image_file_path)
         
         # 3. Create Post
-        print(f"Publishing post with image {image_urn}...")
+        logger.info("Publishing post with image %s...", image_urn)
         post_id = self.create_post(text, image_urn)
-        print(f"Successfully posted! ID: {post_id}")
+        logger.info("Successfully posted! ID: %s", post_id)
         return post_id
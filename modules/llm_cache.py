@@ -0,0 +1,57 @@
+import os
+import gzip
+import time
+import sqlite3
+import hashlib
+import logging
+from contextlib import closing
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    SQLite-backed cache of LLM responses.
+    Values are gzipped text keyed by a SHA-256 of the model and normalized prompt.
+    """
+    def __init__(self, path: str = ".cache/gemini.sqlite"):
+        self.path = path
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with closing(sqlite3.connect(self.path)) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    @staticmethod
+    def normalize_prompt(prompt: str) -> str:
+        """Lowercase and collapse whitespace so cosmetic prompt edits still share entries"""
+        return " ".join(prompt.lower().split())
+
+    def make_key(self, model: str, prompt: str) -> str:
+        return hashlib.sha256((model + "|" + self.normalize_prompt(prompt)).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached text for key, or None if missing/expired"""
+        try:
+            with closing(sqlite3.connect(self.path)) as conn:
+                row = conn.execute(
+                    "SELECT value FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, time.time())
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning("Failed to load cache entry: %s", e)
+            return None
+        if row is None:
+            return None
+        return gzip.decompress(row[0]).decode("utf-8")
+
+    def set(self, key: str, value: str, ttl: int = 86400):
+        try:
+            with closing(sqlite3.connect(self.path)) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, gzip.compress(value.encode("utf-8")), time.time() + ttl)
+                )
+        except sqlite3.Error as e:
+            logger.warning("Failed to save cache entry: %s", e)